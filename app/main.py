@@ -4,19 +4,33 @@ DXF Chat Editor - A simple DXF editor with AI chat interface.
 Upload DXF -> Backend converts to SVG -> User chats -> AI generates ezdxf code -> Execute -> Update SVG
 """
 
+import asyncio
+import functools
+import hashlib
 import io
+import itertools
 import os
+import re
+import secrets
+import stat
 import tempfile
+import threading
 import traceback
+import weakref
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
 from pathlib import Path
 from typing import Optional
+from urllib.parse import quote
 
 import anthropic
 import ezdxf
-from ezdxf.addons.drawing import Frontend, RenderContext
-from fastapi import FastAPI, File, HTTPException, UploadFile
+from ezdxf.addons.drawing import Frontend, RenderContext, layout, svg
+from ezdxf.addons.drawing.config import BackgroundPolicy, ColorPolicy, Configuration
+from fastapi import Depends, FastAPI, File, HTTPException, Request, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, HTMLResponse, Response
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import HTMLResponse, Response
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 
@@ -30,16 +44,96 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Store the current DXF document in memory (simple approach for single user)
-current_doc: Optional[ezdxf.document.Drawing] = None
-current_filename: str = ""
-temp_dir = tempfile.mkdtemp()
+# SVG and DXF are verbose text and compress well
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
+# Each browser gets its own document, identified by a session cookie. Only the
+# most recently used MAX_SESSIONS documents are kept in memory.
+SESSION_COOKIE = "session_id"
+MAX_SESSIONS = 32
+
+# Renders of uploaded files by content hash, in the user's cache dir so they
+# survive server restarts
+svg_cache_dir = (
+    Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "dxf-chat-editor" / "svg"
+)
+
+# Rendered output is cached per document version. `_doc_versions` maps id(doc)
+# to a new number from `_version_counter` whenever the document is loaded or
+# modified, which invalidates old entries.
+_version_counter = itertools.count(1)
+_doc_versions: dict[int, int] = {}
+_svg_cache: dict[tuple, str] = {}
+_pdf_cache: dict[tuple, bytes] = {}
+_layers_cache: dict[int, tuple[int, list[dict]]] = {}
+
+# Rendering, code execution and layer scans run in worker threads. A lock per
+# document keeps them from overlapping, while other sessions carry on in parallel.
+_doc_locks: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+_doc_locks_guard = threading.Lock()
+
+# Configure for light background with black lines
+_SVG_CONFIG = Configuration(
+    background_policy=BackgroundPolicy.OFF,  # Transparent (we'll add bg in CSS)
+    color_policy=ColorPolicy.BLACK,  # All lines black
+    lineweight_scaling=1.5,  # Slightly thicker lines
+)
+
+# Configure for PDF export (white background, normal colors)
+_PDF_CONFIG = Configuration(
+    background_policy=BackgroundPolicy.WHITE,
+    color_policy=ColorPolicy.COLOR,
+    lineweight_scaling=2.0,
+)
+
+# Part of the on-disk cache key, a new ezdxf version may render differently
+_SVG_CONFIG_DIGEST = hashlib.sha256(
+    f"{ezdxf.__version__} {_SVG_CONFIG!r}".encode()
+).hexdigest()[:16]
+
+# Claude's (explanation, code) answers by (system prompt, user message), least
+# recently used first. Answers whose code fails to run are dropped again, so a
+# retry asks Claude instead of replaying the broken code.
+MAX_GENERATED = 512
+_generated: OrderedDict[tuple[str, str], tuple[str, str]] = OrderedDict()
+_generated_lock = threading.Lock()
+
+# A markdown code block in Claude's responses, possibly cut off before the closing fence
+_CODE_BLOCK_RE = re.compile(r"```(?:python)?\s*(.*?)(?:```|\Z)", re.DOTALL)
+
+
+@dataclass
+class Session:
+    """A loaded DXF document and the name it was uploaded as."""
+    doc: ezdxf.document.Drawing
+    filename: str
+
+
+# Loaded documents by session id, least recently used first
+_sessions: OrderedDict[str, Session] = OrderedDict()
 
 
 class ChatRequest(BaseModel):
     message: str
 
 
+class LayerInfo(BaseModel):
+    name: str
+    color: int
+    entity_count: int
+
+
+class LayersResponse(BaseModel):
+    layers: list[LayerInfo]
+
+
+class UploadResponse(BaseModel):
+    success: bool
+    filename: str
+    svg_url: str
+    layers: list[LayerInfo]
+
+
 class ChatResponse(BaseModel):
     response: str
     code: str
@@ -48,63 +142,273 @@ class ChatResponse(BaseModel):
     svg_updated: bool
 
 
+def doc_version(doc: ezdxf.document.Drawing) -> int:
+    """Get the current version of a loaded document."""
+    return _doc_versions.get(id(doc), 0)
+
+
+def bump_doc_version(doc: ezdxf.document.Drawing) -> None:
+    """Mark a document as loaded or changed and drop stale cache entries."""
+    _doc_versions[id(doc)] = next(_version_counter)
+    _prune_caches()
+
+
+def doc_lock(doc: ezdxf.document.Drawing) -> threading.Lock:
+    """Get the lock that serialises all work on a document."""
+    with _doc_locks_guard:
+        lock = _doc_locks.get(doc)
+        if lock is None:
+            lock = _doc_locks[doc] = threading.Lock()
+        return lock
+
+
+def forget_doc(doc: ezdxf.document.Drawing) -> None:
+    """Drop all cache entries of a document which is no longer loaded."""
+    _doc_versions.pop(id(doc), None)
+    _prune_caches()
+
+
+def _prune_caches() -> None:
+    """Drop cache entries of outdated versions and unloaded documents."""
+    for cache in (_svg_cache, _pdf_cache):
+        for key in list(cache):
+            if _doc_versions.get(key[0]) != key[1]:
+                cache.pop(key, None)
+    for doc_id in list(_layers_cache):
+        if doc_id not in _doc_versions:
+            _layers_cache.pop(doc_id, None)
+
+
 def dxf_to_svg(doc: ezdxf.document.Drawing) -> str:
     """Convert ezdxf document to SVG string using ezdxf's SVG backend."""
-    from ezdxf.addons.drawing import svg, layout
-    from ezdxf.addons.drawing.config import Configuration, ColorPolicy, BackgroundPolicy
-
-    # Configure for light background with black lines
-    config = Configuration(
-        background_policy=BackgroundPolicy.OFF,  # Transparent (we'll add bg in CSS)
-        color_policy=ColorPolicy.BLACK,  # All lines black
-        lineweight_scaling=1.5,  # Slightly thicker lines
-    )
+    return render_svg(doc, _SVG_CONFIG)
+
+
+def render_svg(doc: ezdxf.document.Drawing, config: Configuration) -> str:
+    """Render a document to SVG with `config`, cached until the document changes."""
+    with doc_lock(doc):
+        key = (id(doc), doc_version(doc), config)
+        cached = _svg_cache.get(key)
+        if cached is not None:
+            return cached
+
+        svg_string = _draw_svg(doc, config)
+        _svg_cache[key] = svg_string
+        return svg_string
 
-    # Use ezdxf's SVG backend for better compatibility
+
+def _draw_svg(doc: ezdxf.document.Drawing, config: Configuration) -> str:
+    """Render a document to SVG with `config`, the caller holds the document lock."""
     backend = svg.SVGBackend()
     ctx = RenderContext(doc)
     Frontend(ctx, backend, config=config).draw_layout(doc.modelspace())
 
     # Auto-size page (0, 0 means auto)
-    page = layout.Page(0, 0)
+    return backend.get_string(layout.Page(0, 0))
+
 
-    svg_string = backend.get_string(page)
+def private_cache_dir() -> Optional[Path]:
+    """Create the SVG cache dir, None unless only the current user can write to it.
+
+    Cached SVG ends up in the page, so files planted by other users must never be read.
+    """
+    try:
+        svg_cache_dir.mkdir(mode=0o700, parents=True, exist_ok=True)
+        st = os.lstat(svg_cache_dir)
+    except OSError:
+        return None
+    if not stat.S_ISDIR(st.st_mode) or st.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        return None
+    if hasattr(os, "getuid") and st.st_uid != os.getuid():
+        return None
+    return svg_cache_dir
+
+
+def uploaded_dxf_to_svg(doc: ezdxf.document.Drawing, content: bytes) -> str:
+    """Convert a freshly uploaded document to SVG, reusing an earlier render of the same file."""
+    cache_dir = private_cache_dir()
+    if cache_dir is None:
+        return dxf_to_svg(doc)
+
+    digest = hashlib.sha256(content).hexdigest()
+    svg_path = cache_dir / f"{digest}_{_SVG_CONFIG_DIGEST}.svg"
 
+    try:
+        svg_string = svg_path.read_text(encoding="utf-8")
+    except OSError:
+        svg_string = dxf_to_svg(doc)
+        # Write to a temp file first so other processes never read a partial file
+        try:
+            fd, tmp_name = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(svg_string)
+            os.replace(tmp_name, svg_path)
+        except OSError:
+            pass  # The cache is optional
+        return svg_string
+
+    with doc_lock(doc):
+        _svg_cache[(id(doc), doc_version(doc), _SVG_CONFIG)] = svg_string
     return svg_string
 
 
+def dxf_to_pdf(doc: ezdxf.document.Drawing) -> Optional[bytes]:
+    """Convert ezdxf document to PDF bytes via SVG, None if the SVG can't be parsed."""
+    from svglib.svglib import svg2rlg
+    from reportlab.graphics import renderPDF
+
+    with doc_lock(doc):
+        key = (id(doc), doc_version(doc), _PDF_CONFIG)
+        cached = _pdf_cache.get(key)
+        if cached is not None:
+            return cached
+
+        # First create SVG, only the PDF is cached so the SVG isn't kept twice
+        svg_string = _draw_svg(doc, _PDF_CONFIG)
+
+    # Convert SVG to PDF in memory using svglib/reportlab, lxml rejects str
+    # input with an XML encoding declaration, so pass bytes. This doesn't touch
+    # the document, so it runs outside the lock.
+    drawing = svg2rlg(io.BytesIO(svg_string.encode("utf-8")))
+    if drawing is None:
+        return None
+
+    pdf_bytes = renderPDF.drawToString(drawing)
+    with doc_lock(doc):
+        # Skip the store if the document changed meanwhile, the key would be stale
+        if doc_version(doc) == key[1]:
+            _pdf_cache[key] = pdf_bytes
+    return pdf_bytes
+
+
+def attachment_headers(filename: str) -> dict[str, str]:
+    """Build a Content-Disposition download header the way Starlette's FileResponse does."""
+    quoted = quote(filename)
+    if quoted != filename:
+        # Non-ASCII or special characters, headers themselves must be latin-1
+        return {"Content-Disposition": f"attachment; filename*=utf-8''{quoted}"}
+    return {"Content-Disposition": f'attachment; filename="{filename}"'}
+
+
+def read_dxf_bytes(content: bytes) -> ezdxf.document.Drawing:
+    """Load an ASCII or binary DXF document from memory, like ezdxf.readfile()."""
+    from ezdxf.filemanagement import dxf_stream_info
+    from ezdxf.lldxf.const import DXFStructureError
+    from ezdxf.lldxf.tagger import binary_tags_loader
+    from ezdxf.lldxf.validator import is_dxf_stream
+
+    # Truncated input ends the tag loaders early with StopIteration, which
+    # asyncio can't pass out of a worker thread, so raise a real error instead
+    try:
+        if content.startswith(b"AutoCAD Binary DXF\r\n\x1a\x00"):
+            return ezdxf.document.Drawing.load(binary_tags_loader(content))
+
+        if not is_dxf_stream(
+            io.TextIOWrapper(io.BytesIO(content), encoding="utf-8", errors="ignore")
+        ):
+            raise IOError("Upload is not a DXF file.")
+
+        # The header is ASCII, detect the text encoding from it before decoding all
+        info = dxf_stream_info(
+            io.TextIOWrapper(io.BytesIO(content), encoding="utf-8", errors="ignore")
+        )
+        return ezdxf.read(
+            io.TextIOWrapper(io.BytesIO(content), encoding=info.encoding, errors="surrogateescape")
+        )
+    except StopIteration:
+        raise DXFStructureError("Unexpected end of DXF data.") from None
+
+
+def write_dxf_bytes(doc: ezdxf.document.Drawing) -> bytes:
+    """Serialize a DXF document to memory, like Drawing.saveas()."""
+    buffer = io.BytesIO()
+    stream = io.TextIOWrapper(buffer, encoding=doc.output_encoding, errors="dxfreplace")
+    with doc_lock(doc):
+        doc.write(stream)
+    # Detach flushes the text layer without closing the buffer
+    stream.detach()
+    return buffer.getvalue()
+
+
 def get_layers_info(doc: ezdxf.document.Drawing) -> list[dict]:
     """Get information about layers in the document."""
-    layers = []
-    for layer in doc.layers:
-        entity_count = len(list(doc.modelspace().query(f'*[layer=="{layer.dxf.name}"]')))
-        layers.append({
+    # Count entities per layer in a single pass over modelspace
+    counts = Counter(entity.dxf.layer for entity in doc.modelspace())
+    return [
+        {
             "name": layer.dxf.name,
             "color": layer.color,
-            "entity_count": entity_count
-        })
-    return layers
+            "entity_count": counts.get(layer.dxf.name, 0)
+        }
+        for layer in doc.layers
+    ]
+
+
+def get_layers_info_cached(doc: ezdxf.document.Drawing) -> list[dict]:
+    """Get layers information, reusing it until the document version changes."""
+    with doc_lock(doc):
+        version = doc_version(doc)
+        cached = _layers_cache.get(id(doc))
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        layers = get_layers_info(doc)
+        _layers_cache[id(doc)] = (version, layers)
+        return layers
+
+
+@functools.cache
+def get_anthropic_client() -> anthropic.Anthropic:
+    """Create the Anthropic client once so its connection pool is reused."""
+    return anthropic.Anthropic()
 
 
 def generate_ezdxf_code(user_message: str, layers_info: list[dict]) -> tuple[str, str]:
     """Use Claude to generate ezdxf code from natural language."""
-    client = anthropic.Anthropic()
+    key = _generate_key(user_message, layers_info)
+    with _generated_lock:
+        cached = _generated.get(key)
+        if cached is not None:
+            _generated.move_to_end(key)
+            return cached
+
+    generated = _generate(*key)
+    with _generated_lock:
+        _generated[key] = generated
+        if len(_generated) > MAX_GENERATED:
+            _generated.popitem(last=False)
+    return generated
+
 
-    layers_desc = "\n".join([f"- {l['name']}: {l['entity_count']} entities" for l in layers_info])
+def forget_generated_code(user_message: str, layers_info: list[dict]) -> None:
+    """Drop a cached answer, e.g. because its code failed to run."""
+    with _generated_lock:
+        _generated.pop(_generate_key(user_message, layers_info), None)
 
-    system_prompt = f"""You are an expert at writing ezdxf Python code to modify DXF files.
+
+def _generate_key(user_message: str, layers_info: list[dict]) -> tuple[str, str]:
+    layers = tuple((l['name'], l['entity_count']) for l in layers_info)
+    return _system_prompt(layers), user_message
+
+
+@functools.lru_cache(maxsize=64)
+def _system_prompt(layers: tuple[tuple[str, int], ...]) -> str:
+    """Build the system prompt for a snapshot of (layer name, entity count) pairs."""
+    layers_desc = "\n".join(f"- {name}: {count} entities" for name, count in layers)
+
+    return f"""You are an expert at writing ezdxf Python code to modify DXF files.
 
 The current DXF document has these layers:
 {layers_desc}
 
 The user will describe changes they want to make. Generate Python code that:
 1. Uses the variable `doc` which is already loaded as an ezdxf document
-2. Uses `msp = doc.modelspace()` to access entities
+2. Uses `msp = doc.modelspace()` to access entities, or the helper `by_layer("LAYERNAME")`
+   which returns a list of the modelspace entities on that layer
 3. Makes the requested modifications
 4. Does NOT save the file (that's handled separately)
 
 Common ezdxf patterns:
-- Query entities: `msp.query('*[layer=="LAYERNAME"]')` or `msp.query('LINE')`, `msp.query('TEXT')`
+- Query entities: `by_layer("LAYERNAME")` (prefer this over `msp.query('*[layer=="LAYERNAME"]')`) or `msp.query('LINE')`, `msp.query('TEXT')`
 - Delete entity: `msp.delete_entity(entity)`
 - Change text: `entity.dxf.text = "new text"` for TEXT entities
 - Change layer: `entity.dxf.layer = "NEW_LAYER"`
@@ -122,6 +426,11 @@ CODE:
 <your code>
 ```"""
 
+
+def _generate(system_prompt: str, user_message: str) -> tuple[str, str]:
+    """Ask Claude for code."""
+    client = get_anthropic_client()
+
     response = client.messages.create(
         model="claude-sonnet-4-20250514",
         max_tokens=1024,
@@ -129,52 +438,61 @@ CODE:
         messages=[{"role": "user", "content": user_message}]
     )
 
-    text = response.content[0].text
+    return parse_response(response.content[0].text)
+
 
-    # Parse explanation and code
-    explanation = ""
+def parse_response(text: str) -> tuple[str, str]:
+    """Split a Claude response into the explanation and the code to execute."""
+    explanation = "Executing requested changes."
     code = ""
 
-    if "EXPLANATION:" in text:
-        parts = text.split("CODE:")
-        explanation = parts[0].replace("EXPLANATION:", "").strip()
-        if len(parts) > 1:
-            code_part = parts[1]
-            # Extract code from markdown code block
-            if "```python" in code_part:
-                code = code_part.split("```python")[1].split("```")[0].strip()
-            elif "```" in code_part:
-                code = code_part.split("```")[1].split("```")[0].strip()
-            else:
-                code = code_part.strip()
-    else:
-        explanation = "Executing requested changes."
-        if "```python" in text:
-            code = text.split("```python")[1].split("```")[0].strip()
-        elif "```" in text:
-            code = text.split("```")[1].split("```")[0].strip()
+    head, has_code_label, code_part = text.partition("CODE:")
+    if "EXPLANATION:" in head:
+        explanation = head.split("EXPLANATION:", 1)[1].strip()
+    if not has_code_label:
+        code_part = text
+
+    # Prefer a code block after "CODE:", fall back to the plain text after it
+    match = _CODE_BLOCK_RE.search(code_part)
+    if match:
+        code = match.group(1).strip()
+    elif has_code_label:
+        code = code_part.strip()
 
     return explanation, code
 
 
+@functools.lru_cache(maxsize=256)
+def _compile_exec(code: str):
+    """Compile generated code once, repeated prompts return the same source."""
+    return compile(code, "<chat>", "exec")
+
+
 def execute_ezdxf_code(code: str, doc: ezdxf.document.Drawing) -> str:
     """Execute ezdxf code safely and return result message."""
+    msp = doc.modelspace()
+
+    def by_layer(name: str) -> list:
+        """Return the modelspace entities on layer `name`, without the query parser."""
+        return [entity for entity in msp if entity.dxf.layer == name]
+
     # Create execution environment
     exec_globals = {
         "doc": doc,
         "ezdxf": ezdxf,
+        "by_layer": by_layer,
     }
     exec_locals = {}
 
-    # Count entities before
-    msp = doc.modelspace()
-    count_before = len(list(msp))
-
     try:
-        exec(code, exec_globals, exec_locals)
+        # Count entities under the lock, so another chat in this session can't
+        # slip its changes in between the two counts
+        with doc_lock(doc):
+            count_before = len(msp)
+            exec(_compile_exec(code), exec_globals, exec_locals)
+            bump_doc_version(doc)
+            count_after = len(msp)
 
-        # Count entities after
-        count_after = len(list(msp))
         diff = count_after - count_before
 
         if diff < 0:
@@ -185,9 +503,51 @@ def execute_ezdxf_code(code: str, doc: ezdxf.document.Drawing) -> str:
             return "Changes applied successfully"
 
     except Exception as e:
+        # The code may have modified the document before failing
+        with doc_lock(doc):
+            bump_doc_version(doc)
         raise RuntimeError(f"Code execution failed: {str(e)}\n{traceback.format_exc()}")
 
 
+@app.middleware("http")
+async def assign_session(request: Request, call_next):
+    """Give every browser a session cookie so it gets its own document."""
+    session_id = request.cookies.get(SESSION_COOKIE)
+    is_new = session_id is None
+    if is_new:
+        session_id = secrets.token_urlsafe(16)
+    request.state.session_id = session_id
+
+    response = await call_next(request)
+    if is_new:
+        response.set_cookie(SESSION_COOKIE, session_id, httponly=True, samesite="lax")
+    return response
+
+
+def get_session_id(request: Request) -> str:
+    """Dependency returning the session id assigned by the middleware."""
+    return request.state.session_id
+
+
+def get_session(session_id: str) -> Optional[Session]:
+    """Get the document of a session, marking it as recently used."""
+    session = _sessions.get(session_id)
+    if session is not None:
+        _sessions.move_to_end(session_id)
+    return session
+
+
+def store_session(session_id: str, session: Session) -> None:
+    """Store a newly loaded document, evicting the least recently used ones."""
+    previous = _sessions.pop(session_id, None)
+    if previous is not None:
+        forget_doc(previous.doc)
+    _sessions[session_id] = session
+    while len(_sessions) > MAX_SESSIONS:
+        _, evicted = _sessions.popitem(last=False)
+        forget_doc(evicted.doc)
+
+
 @app.get("/", response_class=HTMLResponse)
 async def serve_frontend():
     """Serve the frontend HTML."""
@@ -197,36 +557,31 @@ async def serve_frontend():
     return HTMLResponse(content="<h1>Frontend not found</h1>", status_code=404)
 
 
-@app.post("/api/upload")
-async def upload_dxf(file: UploadFile = File(...)):
-    """Upload a DXF file and convert to SVG."""
-    global current_doc, current_filename
-
+@app.post("/api/upload", response_model=UploadResponse)
+async def upload_dxf(file: UploadFile = File(...), session_id: str = Depends(get_session_id)):
+    """Upload a DXF file and render it, the SVG itself is fetched from /api/svg."""
     if not file.filename.lower().endswith('.dxf'):
         raise HTTPException(status_code=400, detail="File must be a DXF file")
 
     # Read file content
     content = await file.read()
 
-    # Save to temp file (ezdxf needs file path)
-    temp_path = Path(temp_dir) / file.filename
-    temp_path.write_bytes(content)
-
     try:
-        # Load DXF
-        current_doc = ezdxf.readfile(str(temp_path))
-        current_filename = file.filename
+        # Load DXF directly from memory
+        doc = await asyncio.to_thread(read_dxf_bytes, content)
+        bump_doc_version(doc)
+        store_session(session_id, Session(doc=doc, filename=file.filename))
 
-        # Convert to SVG
-        svg_content = dxf_to_svg(current_doc)
+        # Render now so /api/svg is served from the cache
+        await asyncio.to_thread(uploaded_dxf_to_svg, doc, content)
 
         # Get layers info
-        layers = get_layers_info(current_doc)
+        layers = await asyncio.to_thread(get_layers_info_cached, doc)
 
         return {
             "success": True,
             "filename": file.filename,
-            "svg": svg_content,
+            "svg_url": "/api/svg",
             "layers": layers
         }
 
@@ -235,42 +590,40 @@ async def upload_dxf(file: UploadFile = File(...)):
 
 
 @app.get("/api/svg")
-async def get_svg():
+async def get_svg(session_id: str = Depends(get_session_id)):
     """Get current SVG representation."""
-    global current_doc
-
-    if current_doc is None:
+    session = get_session(session_id)
+    if session is None:
         raise HTTPException(status_code=404, detail="No DXF file loaded")
 
-    svg_content = dxf_to_svg(current_doc)
+    svg_content = await asyncio.to_thread(dxf_to_svg, session.doc)
     return Response(content=svg_content, media_type="image/svg+xml")
 
 
-@app.get("/api/layers")
-async def get_layers():
+@app.get("/api/layers", response_model=LayersResponse)
+async def get_layers(session_id: str = Depends(get_session_id)):
     """Get layers information."""
-    global current_doc
-
-    if current_doc is None:
+    session = get_session(session_id)
+    if session is None:
         raise HTTPException(status_code=404, detail="No DXF file loaded")
 
-    return {"layers": get_layers_info(current_doc)}
+    return {"layers": await asyncio.to_thread(get_layers_info_cached, session.doc)}
 
 
 @app.post("/api/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, session_id: str = Depends(get_session_id)):
     """Process chat message and execute ezdxf code."""
-    global current_doc
-
-    if current_doc is None:
+    session = get_session(session_id)
+    if session is None:
         raise HTTPException(status_code=400, detail="No DXF file loaded. Please upload a file first.")
 
+    code = ""
     try:
         # Get layers info for context
-        layers = get_layers_info(current_doc)
+        layers = await asyncio.to_thread(get_layers_info_cached, session.doc)
 
         # Generate code using Claude
-        explanation, code = generate_ezdxf_code(request.message, layers)
+        explanation, code = await asyncio.to_thread(generate_ezdxf_code, request.message, layers)
 
         if not code:
             return ChatResponse(
@@ -282,7 +635,12 @@ async def chat(request: ChatRequest):
             )
 
         # Execute the code
-        result = execute_ezdxf_code(code, current_doc)
+        try:
+            result = await asyncio.to_thread(execute_ezdxf_code, code, session.doc)
+        except RuntimeError:
+            # Retrying the same message should ask Claude again, not replay this code
+            forget_generated_code(request.message, layers)
+            raise
 
         return ChatResponse(
             response=explanation,
@@ -295,7 +653,7 @@ async def chat(request: ChatRequest):
     except RuntimeError as e:
         return ChatResponse(
             response=f"Error executing code: {str(e)}",
-            code=code if 'code' in dir() else "",
+            code=code,
             executed=False,
             result=str(e),
             svg_updated=False
@@ -305,70 +663,33 @@ async def chat(request: ChatRequest):
 
 
 @app.get("/api/export/dxf")
-async def export_dxf():
+async def export_dxf(session_id: str = Depends(get_session_id)):
     """Export current DXF file."""
-    global current_doc, current_filename
-
-    if current_doc is None:
+    session = get_session(session_id)
+    if session is None:
         raise HTTPException(status_code=404, detail="No DXF file loaded")
 
-    # Save to temp file
-    export_name = current_filename.replace('.dxf', '_edited.dxf')
-    export_path = Path(temp_dir) / export_name
-    current_doc.saveas(str(export_path))
+    export_name = session.filename.replace('.dxf', '_edited.dxf')
+    headers = attachment_headers(export_name)
+    dxf_bytes = await asyncio.to_thread(write_dxf_bytes, session.doc)
 
-    return FileResponse(
-        path=str(export_path),
-        filename=export_name,
-        media_type="application/dxf"
-    )
+    return Response(content=dxf_bytes, media_type="application/dxf", headers=headers)
 
 
 @app.get("/api/export/pdf")
-async def export_pdf():
+async def export_pdf(session_id: str = Depends(get_session_id)):
     """Export current drawing as PDF."""
-    global current_doc, current_filename
-
-    if current_doc is None:
+    session = get_session(session_id)
+    if session is None:
         raise HTTPException(status_code=404, detail="No DXF file loaded")
 
-    from ezdxf.addons.drawing import svg, layout
-    from ezdxf.addons.drawing.config import Configuration, ColorPolicy, BackgroundPolicy
-
-    # Configure for PDF export (white background, normal colors)
-    config = Configuration(
-        background_policy=BackgroundPolicy.WHITE,
-        color_policy=ColorPolicy.COLOR,
-        lineweight_scaling=2.0,
-    )
-
-    # First create SVG
-    backend = svg.SVGBackend()
-    ctx = RenderContext(current_doc)
-    Frontend(ctx, backend, config=config).draw_layout(current_doc.modelspace())
-    svg_string = backend.get_string(layout.Page(0, 0))
-
-    # Save SVG temporarily
-    svg_path = Path(temp_dir) / "temp.svg"
-    svg_path.write_text(svg_string)
-
-    # Convert SVG to PDF using svglib/reportlab
-    from svglib.svglib import svg2rlg
-    from reportlab.graphics import renderPDF
-
-    drawing = svg2rlg(str(svg_path))
-    if drawing is None:
+    export_name = session.filename.replace('.dxf', '.pdf')
+    headers = attachment_headers(export_name)
+    pdf_bytes = await asyncio.to_thread(dxf_to_pdf, session.doc)
+    if pdf_bytes is None:
         raise HTTPException(status_code=500, detail="Failed to parse SVG for PDF export")
 
-    export_name = current_filename.replace('.dxf', '.pdf')
-    export_path = Path(temp_dir) / export_name
-    renderPDF.drawToFile(drawing, str(export_path))
-
-    return FileResponse(
-        path=str(export_path),
-        filename=export_name,
-        media_type="application/pdf"
-    )
+    return Response(content=pdf_bytes, media_type="application/pdf", headers=headers)
 
 
 def run():
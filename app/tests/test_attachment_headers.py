@@ -0,0 +1,20 @@
+"""Tests for the Content-Disposition headers of exported files."""
+
+from main import attachment_headers
+
+
+def test_ascii_filename_is_quoted():
+    assert attachment_headers("plan.pdf") == {
+        "Content-Disposition": 'attachment; filename="plan.pdf"'
+    }
+
+
+def test_non_ascii_filename_uses_rfc5987():
+    header = attachment_headers("平面图.pdf")["Content-Disposition"]
+    assert header == "attachment; filename*=utf-8''%E5%B9%B3%E9%9D%A2%E5%9B%BE.pdf"
+    header.encode("latin-1")
+
+
+def test_double_quote_does_not_break_header():
+    header = attachment_headers('a"b.pdf')["Content-Disposition"]
+    assert header == "attachment; filename*=utf-8''a%22b.pdf"
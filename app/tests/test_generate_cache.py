@@ -0,0 +1,58 @@
+"""Tests for caching Claude's answers in the chat endpoint."""
+
+import io
+from types import SimpleNamespace
+
+import ezdxf
+from fastapi.testclient import TestClient
+
+import main
+
+
+class FakeClient:
+    """Stands in for the Anthropic client, always answering with `code`."""
+
+    def __init__(self, code):
+        self.calls = 0
+        self.messages = self
+        self.code = code
+
+    def create(self, **kwargs):
+        self.calls += 1
+        text = f"EXPLANATION: x\nCODE:\n```python\n{self.code}\n```"
+        return SimpleNamespace(content=[SimpleNamespace(text=text)])
+
+
+def chat_client(monkeypatch, code):
+    fake = FakeClient(code)
+    monkeypatch.setattr(main, "get_anthropic_client", lambda: fake)
+    monkeypatch.setattr(main, "_generated", main.OrderedDict())
+
+    doc = ezdxf.new()
+    doc.modelspace().add_line((0, 0), (1, 1))
+    buffer = io.StringIO()
+    doc.write(buffer)
+
+    client = TestClient(main.app)
+    client.post("/api/upload", files={"file": ("a.dxf", buffer.getvalue().encode())})
+    return client, fake
+
+
+def test_failed_code_is_not_replayed(monkeypatch):
+    client, fake = chat_client(monkeypatch, "[][0]")
+
+    for _ in range(3):
+        response = client.post("/api/chat", json={"message": "break it"})
+        assert response.json()["executed"] is False
+
+    assert fake.calls == 3
+
+
+def test_working_code_is_reused(monkeypatch):
+    client, fake = chat_client(monkeypatch, "pass")
+
+    for _ in range(3):
+        response = client.post("/api/chat", json={"message": "do nothing"})
+        assert response.json()["executed"] is True
+
+    assert fake.calls == 1
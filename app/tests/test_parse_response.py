@@ -0,0 +1,40 @@
+"""Tests for parsing Claude responses into explanation and code."""
+
+from main import parse_response
+
+
+def test_labelled_response_with_fenced_code():
+    text = "EXPLANATION: Add a line.\nCODE:\n```python\nmsp.add_line((0, 0), (1, 1))\n```"
+    assert parse_response(text) == ("Add a line.", "msp.add_line((0, 0), (1, 1))")
+
+
+def test_prose_between_code_label_and_fence():
+    text = "EXPLANATION: x\nCODE:\nHere is the code:\n```python\nx=1\n```"
+    assert parse_response(text) == ("x", "x=1")
+
+
+def test_fence_in_explanation_is_ignored():
+    text = "EXPLANATION: Replace ```foo``` with bar.\nCODE:\n```python\nx=1\n```"
+    assert parse_response(text) == ("Replace ```foo``` with bar.", "x=1")
+
+
+def test_plain_code_after_label():
+    assert parse_response("EXPLANATION: x\nCODE:\nprint(2)") == ("x", "print(2)")
+
+
+def test_unterminated_fence():
+    text = "EXPLANATION: Trunc.\nCODE:\n```python\nmsp.add_line((0, 0), (1, 1))"
+    assert parse_response(text) == ("Trunc.", "msp.add_line((0, 0), (1, 1))")
+
+
+def test_unlabelled_fenced_code():
+    assert parse_response("Sure:\n```python\nprint(1)\n```\nDone") == (
+        "Executing requested changes.",
+        "print(1)",
+    )
+    assert parse_response("```\nprint(3)\n```") == ("Executing requested changes.", "print(3)")
+
+
+def test_no_code():
+    assert parse_response("EXPLANATION: nothing here") == ("nothing here", "")
+    assert parse_response("no code at all") == ("Executing requested changes.", "")
@@ -0,0 +1,52 @@
+"""Tests for loading uploaded DXF files from memory."""
+
+import io
+
+import ezdxf
+import pytest
+from ezdxf.lldxf.const import DXFStructureError
+from fastapi.testclient import TestClient
+
+from main import app, read_dxf_bytes, write_dxf_bytes
+
+
+def test_empty_input_is_not_a_dxf_file():
+    with pytest.raises(IOError, match="not a DXF file"):
+        read_dxf_bytes(b"")
+
+
+def test_garbage_is_not_a_dxf_file():
+    with pytest.raises(IOError, match="not a DXF file"):
+        read_dxf_bytes(b"\x00\x01\xffnot a drawing\n" * 10)
+
+
+def test_truncated_input_raises_structure_error():
+    with pytest.raises(DXFStructureError):
+        read_dxf_bytes(b"0\nSECTION\n2\nHEADER\n")
+
+
+def test_binary_dxf():
+    doc = ezdxf.new()
+    doc.modelspace().add_line((0, 0), (1, 1))
+    buffer = io.BytesIO()
+    doc.write(buffer, fmt="bin")
+
+    loaded = read_dxf_bytes(buffer.getvalue())
+    assert [e.dxftype() for e in loaded.modelspace()] == ["LINE"]
+
+
+def test_cp1252_r12_dxf():
+    doc = ezdxf.new("R12")
+    doc.modelspace().add_text("Größe")
+    content = write_dxf_bytes(doc)
+    assert "Größe".encode("cp1252") in content
+
+    loaded = read_dxf_bytes(content)
+    assert [e.dxf.text for e in loaded.modelspace()] == ["Größe"]
+
+
+def test_upload_of_empty_file_fails_cleanly():
+    client = TestClient(app)
+    response = client.post("/api/upload", files={"file": ("e.dxf", b"")})
+    assert response.status_code == 500
+    assert "not a DXF file" in response.json()["detail"]
@@ -0,0 +1,29 @@
+"""Tests for the on-disk SVG cache directory checks."""
+
+import os
+
+import main
+
+
+def test_cache_dir_is_created_private(tmp_path, monkeypatch):
+    cache_dir = tmp_path / "svg"
+    monkeypatch.setattr(main, "svg_cache_dir", cache_dir)
+    assert main.private_cache_dir() == cache_dir
+    assert cache_dir.stat().st_mode & 0o777 == 0o700
+
+
+def test_writable_by_others_is_rejected(tmp_path, monkeypatch):
+    cache_dir = tmp_path / "svg"
+    cache_dir.mkdir()
+    os.chmod(cache_dir, 0o777)
+    monkeypatch.setattr(main, "svg_cache_dir", cache_dir)
+    assert main.private_cache_dir() is None
+
+
+def test_symlink_is_rejected(tmp_path, monkeypatch):
+    target = tmp_path / "elsewhere"
+    target.mkdir(mode=0o700)
+    cache_dir = tmp_path / "svg"
+    cache_dir.symlink_to(target)
+    monkeypatch.setattr(main, "svg_cache_dir", cache_dir)
+    assert main.private_cache_dir() is None